@@ -1,10 +1,16 @@
 import os
+import re
 import logging
-import json
-from datetime import datetime
+import sqlite3
+import time
+from functools import lru_cache
+from datetime import datetime, timezone
+from pathlib import Path
+import orjson
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
 from telegram.constants import ParseMode
+from telegram.helpers import escape_markdown
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -23,162 +29,336 @@ if not BOT_TOKEN:
     # If BOT_TOKEN is not set, raise an error to prevent the bot from starting
     raise ValueError("Please set BOT_TOKEN environment variable in your .env file or environment.")
 
+# Optional webhook mode: when WEBHOOK_URL is set the bot receives updates by webhook on PORT instead of long polling
+WEBHOOK_URL = os.getenv('WEBHOOK_URL') # Public HTTPS URL Telegram should post updates to
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') # Optional; Telegram sends it back so forged requests can be rejected
+PORT = int(os.getenv('PORT', '8443'))
+
 # --- Global Data Storage and Persistence ---
-user_data = {
-    'notes': {},    # Stores notes: {user_id_str: [{note_obj}, ...]}
-    'settings': {}  # Stores user-specific settings: {user_id_str: {'next_note_id': int}}
-}
+# Notes and per-user settings live in a SQLite database; every change is a single-row statement instead of a file rewrite
+DB_FILE = 'notes.db'
+LEGACY_DATA_DIR = 'data' # Former per-user JSON files (data/<user_id>.json), each imported into DB_FILE on startup
+LEGACY_DATA_FILE = 'user_data.json' # Former single JSON file holding every user, imported into DB_FILE on startup
+
+NOTE_COLUMNS = 'note_id, title, content, category, created_at, title_md, category_md' # Columns handlers read from a note
+
+db = sqlite3.connect(DB_FILE, check_same_thread=False)
+db.row_factory = sqlite3.Row
+db.execute('PRAGMA journal_mode=WAL')
+db.execute('PRAGMA synchronous=NORMAL') # In WAL mode commits are still atomic; only the last moments before a power loss are at risk
+db.executescript("""
+CREATE TABLE IF NOT EXISTS notes (
+    user_id INTEGER NOT NULL,
+    note_id INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    content TEXT NOT NULL,
+    category TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    title_md TEXT NOT NULL,    -- Markdown-escaped title for plain text; inside *bold* the raw title is used
+    category_md TEXT NOT NULL, -- Markdown-escaped category, likewise only for use outside entities
+    search_text TEXT NOT NULL, -- Lowercased title, content and category for case-insensitive substring search
+    PRIMARY KEY (user_id, note_id)
+);
+CREATE INDEX IF NOT EXISTS notes_user_category ON notes (user_id, category);
+CREATE TABLE IF NOT EXISTS user_settings (
+    user_id INTEGER PRIMARY KEY,
+    next_note_id INTEGER NOT NULL
+);
+""")
+
+@lru_cache(maxsize=4096)
+def escape_md(text):
+    """Markdown-escape a short, often repeated string such as a category name, memoizing the result."""
+    return escape_markdown(text)
+
+def derived_note_columns(title, content, category):
+    """Column values computed from a note's text: escaped title/category for rendering and its search text."""
+    return {
+        'title_md': escape_markdown(title), # Titles rarely repeat, so they would only churn the escape cache
+        'category_md': escape_md(category),
+        # NUL separators keep a query from matching across the end of one field and the start of the next
+        'search_text': f"{title}\0{content}\0{category}".lower()
+    }
 
-DATA_FILE = 'user_data.json' # The file used for storing all bot data
+def insert_note(user_id, note, keep_existing=False):
+    """Insert a note dict (title, content, category, created_at, note_id) for a user, adding its derived columns to it.
+
+    An existing note with the same ID raises sqlite3.IntegrityError, unless keep_existing is set (legacy imports),
+    in which case the stored note wins and this one is skipped.
+    """
+    note.update(derived_note_columns(note['title'], note['content'], note['category']))
+    db.execute(
+        f"""INSERT {'OR IGNORE ' if keep_existing else ''}INTO notes
+           (user_id, note_id, title, content, category, created_at, title_md, category_md, search_text)
+           VALUES (:user_id, :note_id, :title, :content, :category, :created_at, :title_md, :category_md, :search_text)""",
+        {'user_id': user_id, **note}
+    )
 
-def save_user_data():
-    """Save all user data (notes and settings) to the DATA_FILE."""
-    try:
-        with open(DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(user_data, f, ensure_ascii=False, indent=4)
-        logger.info("User data saved successfully.")
-    except Exception as e:
-        logger.error(f"Error saving user data: {e}")
+def set_next_note_id(user_id, next_note_id):
+    """Store the ID the user's next note will get."""
+    db.execute(
+        'INSERT INTO user_settings (user_id, next_note_id) VALUES (?, ?) '
+        'ON CONFLICT (user_id) DO UPDATE SET next_note_id = excluded.next_note_id',
+        (user_id, next_note_id)
+    )
+
+def raise_next_note_id(user_id, next_note_id):
+    """Make sure the user's next note ID is at least next_note_id, never moving it backwards."""
+    db.execute(
+        'INSERT INTO user_settings (user_id, next_note_id) VALUES (?, ?) '
+        'ON CONFLICT (user_id) DO UPDATE SET next_note_id = MAX(next_note_id, excluded.next_note_id)',
+        (user_id, next_note_id)
+    )
+
+def legacy_json_files():
+    """Paths of former JSON storage files that have not been imported yet."""
+    paths = [LEGACY_DATA_FILE] if os.path.exists(LEGACY_DATA_FILE) else []
+    if os.path.isdir(LEGACY_DATA_DIR):
+        paths.extend(os.path.join(LEGACY_DATA_DIR, name) for name in sorted(os.listdir(LEGACY_DATA_DIR)) if name.endswith('.json'))
+    return paths
+
+def read_legacy_users(path):
+    """Parse one former JSON storage file into [(user key, notes, settings), ...]; raises if it cannot be read."""
+    data = orjson.loads(Path(path).read_bytes())
+    if path == LEGACY_DATA_FILE:
+        settings = data.get('settings', {})
+        return [(user_key, notes, settings.get(user_key, {})) for user_key, notes in data.get('notes', {}).items()]
+    return [(Path(path).stem, data.get('notes', []), data.get('settings', {}))] # data/<user_id>.json
+
+def legacy_user_record(user_key, notes, settings):
+    """Validate one user's legacy entry (numeric user key) into (user_id, notes, next_note_id); raises if any part is malformed."""
+    user_id = int(user_key)
+    notes = [
+        {
+            'note_id': int(note['note_id']),
+            'title': str(note['title']),
+            'content': str(note['content']),
+            'category': str(note['category']),
+            'created_at': str(note['created_at'])
+        }
+        for note in notes
+    ]
+    next_note_id = max([int(settings.get('next_note_id', 1))] + [note['note_id'] + 1 for note in notes])
+    return user_id, notes, next_note_id
+
+def migrate_json_storage():
+    """Import notes from the former JSON storage (single file or per-user files), then set those files aside.
+
+    An unreadable file is renamed to *.unreadable and a malformed user entry is logged and skipped (its file is
+    then kept as *.incomplete), so one bad entry never blocks everyone else's notes from being imported.
+    """
+    users = [] # [(user_id, notes, next_note_id), ...]
+    imported_files = {} # {path: suffix to rename it with once the import is committed}
+    for path in legacy_json_files():
+        try:
+            entries = read_legacy_users(path)
+        except Exception as e:
+            logger.error(f"Error reading legacy data file '{path}': {e}. Keeping it as '{path}.unreadable' and skipping it.")
+            os.replace(path, path + '.unreadable')
+            continue
+        imported_files[path] = '.migrated'
+        for user_key, notes, settings in entries:
+            try:
+                users.append(legacy_user_record(user_key, notes, settings))
+            except Exception as e:
+                logger.error(f"Skipping malformed legacy data for user '{user_key}' in '{path}': {e}. It stays in '{path}.incomplete'.")
+                imported_files[path] = '.incomplete'
+
+    with db:
+        for user_id, notes, next_note_id in users:
+            for note in notes:
+                insert_note(user_id, note, keep_existing=True)
+            # A re-imported file, or a user in both user_data.json and data/, must not reuse IDs already handed out
+            raise_next_note_id(user_id, next_note_id)
+
+    # Set the files aside only once their notes are committed, so a failed import is retried on the next start
+    for path, suffix in imported_files.items():
+        os.replace(path, path + suffix)
+    migrated_files = sum(1 for suffix in imported_files.values() if suffix == '.migrated')
+    logger.info(f"Migrated {len(users)} user(s) from {migrated_files} complete JSON file(s) into '{DB_FILE}'.")
 
 def load_user_data():
-    """Load all user data (notes and settings) from the DATA_FILE."""
-    global user_data # Declare intent to modify the global user_data variable
-    try:
-        if os.path.exists(DATA_FILE):
-            with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                user_data = json.load(f)
-            logger.info("User data loaded successfully.")
-        else:
-            logger.info(f"User data file '{DATA_FILE}' not found, starting with empty data.")
-            user_data = {'notes': {}, 'settings': {}} # Initialize if file doesn't exist
-    except json.JSONDecodeError as e:
-        logger.error(f"Error decoding JSON from user data file: {e}. Starting with empty data.")
-        user_data = {'notes': {}, 'settings': {}} # Fallback to empty data on corruption
-    except Exception as e:
-        logger.error(f"Error loading user data: {e}. Starting with empty data.")
-        user_data = {'notes': {}, 'settings': {}} # Fallback on other errors
-
-# Load existing data when the bot starts
+    """Import any data left in the former JSON storage; everything else is read from the database on demand."""
+    if legacy_json_files():
+        migrate_json_storage()
+
+async def close_database(application):
+    """post_shutdown hook: close the database connection cleanly."""
+    db.close()
+
+# Prepare storage when the bot starts
 load_user_data()
 
 # --- Helper functions for note management ---
+# Helpers take the user's Telegram id as the int it arrives as, matching the INTEGER user_id column; no str() round-trips.
 
 NOTES_PER_PAGE = 5 # Define how many notes to show per page for pagination
 
-def get_user_notes(user_id):
-    """Get all notes for a specific user, sorted by creation date (newest first)."""
-    return sorted(
-        user_data['notes'].get(str(user_id), []),
-        key=lambda x: datetime.fromisoformat(x['created_at']),
-        reverse=True
-    )
+# One 'Title:' / 'Category:' / 'Content:' header line at the current position, after any blank lines
+NOTE_HEADER_LINE_RE = re.compile(r'(?:[ \t]*\n)*(title|category|content):[ \t]*([^\n]*)\n?', re.IGNORECASE)
+# A 'Title:' / 'Category:' line on its own, as found at the end of a note without a 'Content:' line
+NOTE_TRAILER_LINE_RE = re.compile(r'(title|category):[ \t]*(.*)', re.IGNORECASE)
+
+def parse_note_header(text):
+    """Split a new note into (title, category, content) using optional 'Title:' / 'Category:' / 'Content:' lines.
+
+    Header lines may come in any order, with blank lines between them; 'Content:' starts the body, which then runs
+    to the end of the message. Without a 'Content:' line, 'Title:' / 'Category:' lines at the very end count too.
+    """
+    fields = {}
+    pos = 0
+    while True:
+        match = NOTE_HEADER_LINE_RE.match(text, pos)
+        if not match or match.group(1).lower() == 'content':
+            break
+        fields[match.group(1).lower()] = match.group(2).strip()
+        pos = match.end()
+
+    if match:
+        body = text[match.start(2):]
+    else:
+        body = text[pos:].rstrip()
+        trailing_fields = {}
+        while body:
+            rest, _, last_line = body.rpartition('\n')
+            trailer = NOTE_TRAILER_LINE_RE.fullmatch(last_line)
+            if not trailer:
+                break
+            trailing_fields.setdefault(trailer.group(1).lower(), trailer.group(2).strip()) # The last line wins
+            body = rest.rstrip()
+        fields.update(trailing_fields)
+
+    return fields.get('title') or None, fields.get('category') or 'General', body.strip() or text
+
+NOTE_HEADER_HINT_RE = re.compile(r'^(?:title|category|content):', re.IGNORECASE | re.MULTILINE) # A message without such a line has no header
+
+def get_user_notes(user_id, category=None, limit=-1, offset=0):
+    """Get a user's notes newest first (note IDs only ever increase), optionally one category and one page of them."""
+    if category:
+        rows = db.execute(
+            f'SELECT {NOTE_COLUMNS} FROM notes WHERE user_id = ? AND category = ? ORDER BY note_id DESC LIMIT ? OFFSET ?',
+            (user_id, category, limit, offset)
+        )
+    else:
+        rows = db.execute(
+            f'SELECT {NOTE_COLUMNS} FROM notes WHERE user_id = ? ORDER BY note_id DESC LIMIT ? OFFSET ?',
+            (user_id, limit, offset)
+        )
+    return [dict(row) for row in rows]
 
-def add_user_note(user_id, title, content, category='General'):
-    """Add a new note for a user with a unique incrementing ID."""
-    user_id_str = str(user_id)
-
-    if user_id_str not in user_data['notes']:
-        user_data['notes'][user_id_str] = []
-    if user_id_str not in user_data['settings']:
-        user_data['settings'][user_id_str] = {'next_note_id': 1}
-
-    user_settings = user_data['settings'][user_id_str]
-    note_id = user_settings['next_note_id']
-    user_settings['next_note_id'] += 1
-
-    note = {
-        'title': title,
-        'content': content,
-        'category': category,
-        'created_at': datetime.now().isoformat(),
-        'note_id': note_id
-    }
+def count_user_notes(user_id, category=None):
+    """Count a user's notes, optionally only those in one category."""
+    if category:
+        row = db.execute('SELECT COUNT(*) FROM notes WHERE user_id = ? AND category = ?', (user_id, category)).fetchone()
+    else:
+        row = db.execute('SELECT COUNT(*) FROM notes WHERE user_id = ?', (user_id,)).fetchone()
+    return row[0]
 
-    user_data['notes'][user_id_str].append(note)
-    save_user_data()
-    return note['note_id']
+def add_user_note(user_id, title, content, category='General'):
+    """Add a new note for a user with a unique incrementing ID and return it."""
+    with db:
+        row = db.execute('SELECT next_note_id FROM user_settings WHERE user_id = ?', (user_id,)).fetchone()
+        note_id = row['next_note_id'] if row else 1
+        note = {
+            'title': title,
+            'content': content,
+            'category': category,
+            'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'note_id': note_id
+        }
+        insert_note(user_id, note)
+        set_next_note_id(user_id, note_id + 1)
+    return note
 
 def delete_user_note(user_id, note_id):
     """Delete a specific note by its ID for a given user."""
-    user_id_str = str(user_id)
-    if user_id_str in user_data['notes']:
-        initial_len = len(user_data['notes'][user_id_str])
-        user_data['notes'][user_id_str] = [note for note in user_data['notes'][user_id_str] if note['note_id'] != note_id]
-        if len(user_data['notes'][user_id_str]) < initial_len:
-            save_user_data()
-            return True
-    return False
+    with db:
+        cursor = db.execute('DELETE FROM notes WHERE user_id = ? AND note_id = ?', (user_id, note_id))
+    return cursor.rowcount > 0
 
 def get_user_note(user_id, note_id):
     """Retrieve a specific note by its ID for a given user."""
-    user_id_str = str(user_id)
-    if user_id_str in user_data['notes']:
-        for note in user_data['notes'][user_id_str]:
-            if note['note_id'] == note_id:
-                return note
-    return None
+    row = db.execute(
+        f'SELECT {NOTE_COLUMNS} FROM notes WHERE user_id = ? AND note_id = ?', (user_id, note_id)
+    ).fetchone()
+    return dict(row) if row else None
 
 def update_user_note_category(user_id, note_id, new_category):
     """Update the category of an existing note."""
-    user_id_str = str(user_id)
-    if user_id_str in user_data['notes']:
-        for note in user_data['notes'][user_id_str]:
-            if note['note_id'] == note_id:
-                note['category'] = new_category
-                save_user_data()
-                return True
-    return False
+    note = get_user_note(user_id, note_id)
+    if not note:
+        return False
+    if note['category'] == new_category:
+        return True # Nothing changed, so skip the write
+    with db:
+        db.execute(
+            'UPDATE notes SET category = :category, title_md = :title_md, category_md = :category_md, search_text = :search_text '
+            'WHERE user_id = :user_id AND note_id = :note_id',
+            {
+                'user_id': user_id,
+                'note_id': note_id,
+                'category': new_category,
+                **derived_note_columns(note['title'], note['content'], new_category)
+            }
+        )
+    return True
 
 def search_user_notes(user_id, query):
     """Search notes for a user by matching query in title, content, or category (case-insensitive)."""
-    user_id_str = str(user_id)
-    if user_id_str not in user_data['notes']:
-        return []
-
-    query = query.lower()
-    results = []
-    for note in user_data['notes'][user_id_str]:
-        if (query in note['title'].lower() or
-            query in note['content'].lower() or
-            query in note['category'].lower()):
-            results.append(note)
-
-    return sorted(results, key=lambda x: datetime.fromisoformat(x['created_at']), reverse=True)
-
-def get_user_categories(user_id):
-    """Get all unique categories associated with a user's notes, sorted alphabetically."""
-    user_id_str = str(user_id)
-    if user_id_str not in user_data['notes']:
-        return []
-
-    categories = set()
-    for note in user_data['notes'][user_id_str]:
-        categories.add(note['category'])
+    rows = db.execute(
+        f'SELECT {NOTE_COLUMNS} FROM notes WHERE user_id = ? AND instr(search_text, ?) > 0 ORDER BY note_id DESC',
+        (user_id, query.lower())
+    )
+    return [dict(row) for row in rows]
 
-    return sorted(list(categories))
+def get_user_category_counts(user_id):
+    """Return [(category, note count), ...] for a user, sorted alphabetically by category."""
+    rows = db.execute(
+        'SELECT category, COUNT(*) FROM notes WHERE user_id = ? GROUP BY category ORDER BY category', (user_id,)
+    )
+    return [tuple(row) for row in rows]
+
+def get_user_summary(user_id):
+    """Return (note count, category count) for a user."""
+    row = db.execute('SELECT COUNT(*), COUNT(DISTINCT category) FROM notes WHERE user_id = ?', (user_id,)).fetchone()
+    return row[0], row[1]
+
+def clear_user_notes(user_id):
+    """Delete all of a user's notes and restart their note IDs; returns False if there was nothing to clear."""
+    with db:
+        cursor = db.execute('DELETE FROM notes WHERE user_id = ?', (user_id,))
+        if cursor.rowcount == 0:
+            return False
+        set_next_note_id(user_id, 1)
+    return True
+
+@lru_cache(maxsize=4096)
+def created_display(created_at):
+    """Format a stored creation time as local 'YYYY-MM-DD HH:MM'; memoized since a note's timestamp never changes."""
+    return datetime.fromisoformat(created_at).astimezone().strftime('%Y-%m-%d %H:%M')
+
+current_time_cache = {'minute': None, 'text': ''} # Last formatted wall-clock minute, shared by all stats renders
+
+def current_time_display():
+    """Current local time as 'YYYY-MM-DD HH:MM', formatted at most once per minute."""
+    minute = int(time.time() // 60)
+    if minute != current_time_cache['minute']:
+        current_time_cache['minute'] = minute
+        current_time_cache['text'] = datetime.now().strftime('%Y-%m-%d %H:%M')
+    return current_time_cache['text']
+
+def truncate_text(text, limit):
+    """Shorten text to `limit` characters plus a single-character ellipsis, returning it unchanged if it already fits."""
+    return text if len(text) <= limit else text[:limit] + '…'
 
 # --- Bot handlers ---
 
 # Define a constant for the 'Back to Main Menu' button for reusability
 BACK_TO_MAIN_MENU_BUTTON = InlineKeyboardButton("🔙 Main Menu", callback_data='back_to_main')
 
-def get_main_keyboard():
-    """Returns the main inline keyboard markup for bot navigation."""
-    keyboard = [
-        [InlineKeyboardButton("➕ New Note", callback_data='new_note')],
-        [InlineKeyboardButton("📋 My Notes", callback_data='view_notes_page_0')],
-        [InlineKeyboardButton("🔍 Search Notes", callback_data='search_notes')],
-        [InlineKeyboardButton("🗂️ Categories", callback_data='view_categories')],
-        [InlineKeyboardButton("📊 Statistics", callback_data='stats')],
-        [InlineKeyboardButton("❓ Help Guide", callback_data='help')]
-    ]
-    return InlineKeyboardMarkup(keyboard)
-
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handles the /start command, sending a welcome message and the main menu."""
-    user = update.effective_user
-    welcome_text = f"""
-👋 Hello {user.first_name}! Welcome to *Notepad++ Bot*! 📝
+# Static message bodies, built once at import time instead of on every update
+WELCOME_TEMPLATE = """
+👋 Hello {name}! Welcome to *Notepad++ Bot*! 📝
 
 ✨ *Features:*
 • 📝 Create and save notes with titles
@@ -201,7 +381,93 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 Simply send me any text to save it as a quick note! 🚀
 """
-    await update.message.reply_text(welcome_text, parse_mode=ParseMode.MARKDOWN, reply_markup=get_main_keyboard())
+
+WELCOME_BACK_TEMPLATE = "👋 *Welcome back {name}!* What would you like to do?"
+
+STATS_TEMPLATE = """
+📊 *Your Statistics*
+
+📝 *Total Notes:* {total_notes}
+🗂️ *Categories:* {total_categories}
+📅 *Last Updated:* {updated}
+
+Keep adding notes to build your knowledge base! 🚀
+"""
+
+NO_NOTES_TEXT = "📭 You don't have any notes yet. Use /new to create one!"
+NO_NOTES_IN_CATEGORY_TEMPLATE = "📭 You don't have any notes yet in the category *{category}*. Use /new to create one!"
+
+HELP_TEXT = """
+🤖 *Notepad++ Bot Help Guide*
+
+*Commands:*
+`/start` - Start the bot and see the main menu
+`/new` - Create a new note
+`/mynotes` - View your notes (with pagination)
+`/search` - Search through notes
+`/categories` - View and navigate through categories
+`/stats` - Show your note statistics
+`/clear` - Clear all your notes
+`/help` - Show this help guide
+
+*How to Create Notes:*
+1.  Simply send any text message to save it as a "Quick Note".
+2.  For detailed notes, use the format:
+    `Title: My Awesome Note`
+    `Category: Ideas`
+    `Content: This is the detailed content of my note, it can be long and support Markdown! *bold*, _italic_, `code` etc.`
+    (Category and Title are optional, will be auto-generated or default to 'General'/'Quick Notes'.)
+
+*Navigation:*
+• Use the inline buttons provided with messages for easy navigation between features.
+• You can *edit a note's category* by viewing the note and clicking 'Edit Category'.
+• The "🔙 Main Menu" button will take you back to the bot's main options.
+
+📝 Happy note-taking!
+"""
+
+# Static keyboards, built once and shared by every message that shows them
+MAIN_MENU_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("➕ New Note", callback_data='new_note')],
+    [InlineKeyboardButton("📋 My Notes", callback_data='view_notes:0')],
+    [InlineKeyboardButton("🔍 Search Notes", callback_data='search_notes')],
+    [InlineKeyboardButton("🗂️ Categories", callback_data='view_categories')],
+    [InlineKeyboardButton("📊 Statistics", callback_data='stats')],
+    [InlineKeyboardButton("❓ Help Guide", callback_data='help')]
+])
+BACK_TO_MAIN_MENU_MARKUP = InlineKeyboardMarkup([[BACK_TO_MAIN_MENU_BUTTON]])
+NO_CATEGORIES_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("➕ New Note", callback_data='new_note')],
+    [BACK_TO_MAIN_MENU_BUTTON]
+])
+POST_DELETE_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📋 View Notes", callback_data='view_notes:0')],
+    [InlineKeyboardButton("➕ New Note", callback_data='new_note')],
+    [BACK_TO_MAIN_MENU_BUTTON]
+])
+
+# Static rows appended below the per-note and category buttons of list views; built once, shared by every render
+NOTES_LIST_FOOTER_ROWS = (
+    (InlineKeyboardButton("🔍 Search Notes", callback_data='search_notes'),),
+    (InlineKeyboardButton("🗂️ View Categories", callback_data='view_categories'),),
+    (InlineKeyboardButton("➕ New Note", callback_data='new_note'),),
+    (BACK_TO_MAIN_MENU_BUTTON,)
+)
+SEARCH_RESULTS_FOOTER_ROWS = (
+    (InlineKeyboardButton("📋 Back to Notes", callback_data='view_notes:0'),), # This goes back to all notes, not main menu
+    (InlineKeyboardButton("➕ New Note", callback_data='new_note'),),
+    (BACK_TO_MAIN_MENU_BUTTON,)
+)
+CATEGORIES_FOOTER_ROWS = (
+    (InlineKeyboardButton("📋 View All Notes", callback_data='view_notes:0'),),
+    (InlineKeyboardButton("➕ New Note", callback_data='new_note'),),
+    (BACK_TO_MAIN_MENU_BUTTON,)
+)
+
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handles the /start command, sending a welcome message and the main menu."""
+    user = update.effective_user
+    await update.message.reply_text(WELCOME_TEMPLATE.format(name=user.first_name), parse_mode=ParseMode.MARKDOWN, reply_markup=MAIN_MENU_MARKUP)
 
 async def new_note(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Initiates the process for creating a new note."""
@@ -229,11 +495,10 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         note_id = context.user_data.pop('awaiting_category_for_note_id')
         new_category = text.strip()
 
-        note = get_user_note(user_id, note_id)
-        if note and update_user_note_category(user_id, note_id, new_category):
+        if update_user_note_category(user_id, note_id, new_category):
             keyboard = [
-                [InlineKeyboardButton("📄 View Note", callback_data=f'view_note_{note_id}')],
-                [InlineKeyboardButton("📋 My Notes", callback_data='view_notes_page_0')],
+                [InlineKeyboardButton("📄 View Note", callback_data=f'view_note:{note_id}')],
+                [InlineKeyboardButton("📋 My Notes", callback_data='view_notes:0')],
                 [InlineKeyboardButton("➕ New Note", callback_data='new_note')],
                 [BACK_TO_MAIN_MENU_BUTTON] # Added Back button
             ]
@@ -250,53 +515,33 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if context.user_data.get('awaiting_note'):
         context.user_data['awaiting_note'] = False
 
-        title = None
-        category = 'General'
-        content = text
-
-        lines = text.split('\n')
-        parsed_content_lines = []
-        is_content_explicitly_set = False
-
-        for line in lines:
-            line_lower = line.lower()
-            if line_lower.startswith('title:'):
-                title = line.split(':', 1)[1].strip()
-            elif line_lower.startswith('category:'):
-                category = line.split(':', 1)[1].strip()
-            elif line_lower.startswith('content:'):
-                content = line.split(':', 1)[1].strip()
-                is_content_explicitly_set = True
-                parsed_content_lines = []
-            else:
-                if not is_content_explicitly_set and not (line_lower.startswith('title:') or line_lower.startswith('category:')):
-                    parsed_content_lines.append(line)
-
-        if not is_content_explicitly_set:
-            content = "\n".join(parsed_content_lines).strip()
-            if not content:
-                content = text
+        if NOTE_HEADER_HINT_RE.search(text):
+            title, category, content = parse_note_header(text)
+        else:
+            # Usual case: no header, so the whole message is the content and parsing is skipped
+            title, category, content = None, 'General', text.strip() or text
 
         if not title:
-            title = content[:50] + '...' if len(content) > 50 else content
+            title = truncate_text(content, 50)
             if not title:
                 title = "Untitled Note"
 
-        note_id = add_user_note(user_id, title, content, category)
+        note = add_user_note(user_id, title, content, category)
+        note_id = note['note_id']
 
         keyboard = [
-            [InlineKeyboardButton("📋 View All Notes", callback_data='view_notes_page_0')],
+            [InlineKeyboardButton("📋 View All Notes", callback_data='view_notes:0')],
             [InlineKeyboardButton("➕ Another Note", callback_data='new_note')],
-            [InlineKeyboardButton("📄 View This Note", callback_data=f'view_note_{note_id}')],
+            [InlineKeyboardButton("📄 View This Note", callback_data=f'view_note:{note_id}')],
             [BACK_TO_MAIN_MENU_BUTTON] # Added Back button
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
 
         await update.message.reply_text(
             f"✅ *Note saved successfully!* (`#{note_id}`)\n\n"
-            f"📌 *Title:* {title}\n"
-            f"🗂️ *Category:* {category}\n"
-            f"📄 *Content:* {content[:150]}{'...' if len(content) > 150 else ''}\n\n"
+            f"📌 *Title:* {note['title_md']}\n"
+            f"🗂️ *Category:* {note['category_md']}\n"
+            f"📄 *Content:* {truncate_text(content, 150)}\n\n"
             f"You can view, edit category, or delete this note using buttons!",
             parse_mode=ParseMode.MARKDOWN,
             reply_markup=reply_markup
@@ -315,84 +560,85 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     else:
-        title = text[:50] + '...' if len(text) > 50 else text
+        title = truncate_text(text, 50)
         if not title:
             title = "Untitled Quick Note"
 
-        note_id = add_user_note(user_id, title, text, category='Quick Notes')
+        note = add_user_note(user_id, title, text, category='Quick Notes')
+        note_id = note['note_id']
 
         keyboard = [
-            [InlineKeyboardButton("📋 View All Notes", callback_data='view_notes_page_0')],
+            [InlineKeyboardButton("📋 View All Notes", callback_data='view_notes:0')],
             [InlineKeyboardButton("➕ Another Note", callback_data='new_note')],
-            [InlineKeyboardButton("📄 View This Note", callback_data=f'view_note_{note_id}')],
+            [InlineKeyboardButton("📄 View This Note", callback_data=f'view_note:{note_id}')],
             [BACK_TO_MAIN_MENU_BUTTON] # Added Back button
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
 
         await update.message.reply_text(
             f"✍️ *Quick Note saved!* (`#{note_id}`)\n\n"
-            f"📌 *Title:* {title}\n"
+            f"📌 *Title:* {note['title_md']}\n"
             f"🗂️ *Category:* Quick Notes\n"
-            f"📄 *Content:* {text[:100]}{'...' if len(text) > 100 else ''}\n\n"
+            f"📄 *Content:* {truncate_text(text, 100)}\n\n"
             f"You can use the `/new` command or the '➕ New Note' button for more detailed options!",
             parse_mode=ParseMode.MARKDOWN,
             reply_markup=reply_markup
         )
 
 
-async def send_notes_page(target_message, context, page: int, category: str = None):
-    """Helper function to send a paginated list of notes (either via command or callback)."""
-    user_id = target_message.chat.id
-    all_notes = get_user_notes(user_id)
-
-    if category and category != 'All':
-        all_notes = [note for note in all_notes if note['category'] == category]
-        
-    if not all_notes:
-        text = f"📭 You don't have any notes yet {'in the category *'+category+'*' if category else ''}. Use /new to create one!"
-        reply_func = target_message.reply_text if target_message.from_user else target_message.edit_message_text
-        # Ensure the main keyboard is always available if no notes are found
-        await reply_func(text, parse_mode=ParseMode.MARKDOWN, reply_markup=get_main_keyboard())
-        return
-
-    total_pages = (len(all_notes) + NOTES_PER_PAGE - 1) // NOTES_PER_PAGE
-    current_page = max(0, min(page, total_pages - 1))
-    start_index = current_page * NOTES_PER_PAGE
-    end_index = start_index + NOTES_PER_PAGE
-    notes_on_page = all_notes[start_index:end_index]
-
-    message_lines = [f"📋 *Your Notes ({'Category: *' + category + '*' if category else 'All Notes'} - Page {current_page + 1}/{total_pages}):*\n"]
-    keyboard = []
+def render_notes_page(header, notes_on_page, current_page, total_pages, page_callback_data, footer_rows):
+    """Build the text and keyboard for one page of a note list, shared by the notes and search results views.
 
-    for note in notes_on_page:
-        message_lines.append(f"• #{note['note_id']}: *{note['title']}* ({note['category']})")
-        keyboard.append([
-            InlineKeyboardButton(f"📄 View #{note['note_id']}", callback_data=f'view_note_{note["note_id"]}'),
-            InlineKeyboardButton(f"❌ Delete #{note['note_id']}", callback_data=f'delete_note_{note["note_id"]}')
-        ])
+    page_callback_data(page) gives the callback_data of the Previous/Next buttons; footer_rows go below them.
+    """
+    text = f"{header}\n\n" + "\n".join(
+        f"• #{note['note_id']}: *{note['title']}* ({note['category_md']})" for note in notes_on_page
+    )
+    keyboard = [
+        [
+            InlineKeyboardButton(f"📄 View #{note['note_id']}", callback_data=f'view_note:{note["note_id"]}'),
+            InlineKeyboardButton(f"❌ Delete #{note['note_id']}", callback_data=f'delete_note:{note["note_id"]}')
+        ]
+        for note in notes_on_page
+    ]
 
     pagination_buttons = []
     if current_page > 0:
-        pagination_buttons.append(InlineKeyboardButton("⬅️ Previous", callback_data=f'view_notes_page_{current_page-1}{f"_cat_{category}" if category else ""}'))
+        pagination_buttons.append(InlineKeyboardButton("⬅️ Previous", callback_data=page_callback_data(current_page - 1)))
     if current_page < total_pages - 1:
-        pagination_buttons.append(InlineKeyboardButton("Next ➡️", callback_data=f'view_notes_page_{current_page+1}{f"_cat_{category}" if category else ""}'))
+        pagination_buttons.append(InlineKeyboardButton("Next ➡️", callback_data=page_callback_data(current_page + 1)))
     if pagination_buttons:
         keyboard.append(pagination_buttons)
 
-    keyboard.extend([
-        [InlineKeyboardButton("🔍 Search Notes", callback_data='search_notes')],
-        [InlineKeyboardButton("🗂️ View Categories", callback_data='view_categories')],
-        [InlineKeyboardButton("➕ New Note", callback_data='new_note')],
-        [BACK_TO_MAIN_MENU_BUTTON] # Added Back button
-    ])
+    keyboard.extend(footer_rows)
+    return text, InlineKeyboardMarkup(keyboard)
 
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    text_to_send = "\n".join(message_lines)
+async def send_notes_page(target_message, context, page: int, category: str = None):
+    """Helper function to send a paginated list of notes (either via command or callback)."""
+    user_id = target_message.chat.id
+    category_filter = category if category != 'All' else None
+    total_notes = count_user_notes(user_id, category_filter)
+    reply_func = target_message.reply_text if target_message.from_user else target_message.edit_message_text
 
-    if target_message.from_user:
-        await target_message.reply_text(text_to_send, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
-    else:
-        await target_message.edit_message_text(text_to_send, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
+    if not total_notes:
+        text = NO_NOTES_IN_CATEGORY_TEMPLATE.format(category=category) if category else NO_NOTES_TEXT
+        # Ensure the main keyboard is always available if no notes are found
+        await reply_func(text, parse_mode=ParseMode.MARKDOWN, reply_markup=MAIN_MENU_MARKUP)
+        return
+
+    total_pages = (total_notes + NOTES_PER_PAGE - 1) // NOTES_PER_PAGE
+    current_page = max(0, min(page, total_pages - 1))
+    # Only the notes shown on this page are read from the database
+    notes_on_page = get_user_notes(user_id, category_filter, NOTES_PER_PAGE, current_page * NOTES_PER_PAGE)
+
+    category_suffix = f":{category}" if category else ""
+    text, reply_markup = render_notes_page(
+        f"📋 *Your Notes ({'Category: ' + category if category else 'All Notes'} - Page {current_page + 1}/{total_pages}):*",
+        notes_on_page, current_page, total_pages,
+        lambda page: f'view_notes:{page}{category_suffix}',
+        NOTES_LIST_FOOTER_ROWS
+    )
+    await reply_func(text, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
 
 async def my_notes(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles the /mynotes command to show the first page of user's notes."""
@@ -400,49 +646,26 @@ async def my_notes(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def send_search_results_page(target_message, context, query: str, page: int):
     """Helper function to send a paginated list of search results."""
-    user_id = target_message.chat.id
     results = context.user_data.get('last_search_results', [])
-    
+    reply_func = target_message.reply_text if target_message.from_user else target_message.edit_message_text
+
     if not results:
         text = "🔍 No notes found matching your search."
-        reply_func = target_message.reply_text if target_message.from_user else target_message.edit_message_text
-        await reply_func(text, parse_mode=ParseMode.MARKDOWN, reply_markup=get_main_keyboard())
+        await reply_func(text, parse_mode=ParseMode.MARKDOWN, reply_markup=MAIN_MENU_MARKUP)
         return
 
     total_pages = (len(results) + NOTES_PER_PAGE - 1) // NOTES_PER_PAGE
     current_page = max(0, min(page, total_pages - 1))
     start_index = current_page * NOTES_PER_PAGE
-    end_index = start_index + NOTES_PER_PAGE
-    notes_on_page = results[start_index:end_index]
-
-    message_lines = [f"🔍 *Search Results for '{query}' (Page {current_page + 1}/{total_pages}):*\n"]
-    keyboard = []
-
-    for note in notes_on_page:
-        message_lines.append(f"• #{note['note_id']}: *{note['title']}* ({note['category']})")
-        keyboard.append([
-            InlineKeyboardButton(f"📄 View #{note['note_id']}", callback_data=f'view_note_{note["note_id"]}'),
-            InlineKeyboardButton(f"❌ Delete #{note['note_id']}", callback_data=f'delete_note_{note["note_id"]}')
-        ])
-
-    pagination_buttons = []
-    if current_page > 0:
-        pagination_buttons.append(InlineKeyboardButton("⬅️ Previous", callback_data=f'search_results_page_{current_page-1}'))
-    if current_page < total_pages - 1:
-        pagination_buttons.append(InlineKeyboardButton("Next ➡️", callback_data=f'search_results_page_{current_page+1}'))
-    if pagination_buttons:
-        keyboard.append(pagination_buttons)
-
-    keyboard.extend([
-        [InlineKeyboardButton("📋 Back to Notes", callback_data='view_notes_page_0')], # This goes back to all notes, not main menu
-        [InlineKeyboardButton("➕ New Note", callback_data='new_note')],
-        [BACK_TO_MAIN_MENU_BUTTON] # Added Back button
-    ])
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    notes_on_page = results[start_index:start_index + NOTES_PER_PAGE]
 
-    text_to_send = "\n".join(message_lines)
-    reply_func = target_message.reply_text if target_message.from_user else target_message.edit_message_text
-    await reply_func(text_to_send, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
+    text, reply_markup = render_notes_page(
+        f"🔍 *Search Results for '{query}' (Page {current_page + 1}/{total_pages}):*",
+        notes_on_page, current_page, total_pages,
+        lambda page: f'search_results:{page}',
+        SEARCH_RESULTS_FOOTER_ROWS
+    )
+    await reply_func(text, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
 
 
 async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -456,298 +679,250 @@ async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def categories_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles the /categories command, showing all unique categories and options to view notes within them."""
     user_id = update.effective_user.id
-    categories = get_user_categories(user_id)
+    category_counts = get_user_category_counts(user_id)
 
     target_object = update.message if update.message else update.callback_query
     reply_func = target_object.reply_text if update.message else target_object.edit_message_text
 
-    if not categories:
+    if not category_counts:
         text = "🗂️ You don't have any categories yet. Notes will be saved under 'General' or 'Quick Notes' by default."
-        reply_markup = InlineKeyboardMarkup([
-            [InlineKeyboardButton("➕ New Note", callback_data='new_note')],
-            [BACK_TO_MAIN_MENU_BUTTON] # Added Back button
-        ])
-        await reply_func(text, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
+        await reply_func(text, parse_mode=ParseMode.MARKDOWN, reply_markup=NO_CATEGORIES_MARKUP)
         return
 
-    message = "🗂️ *Your Categories:*\n\n"
-    keyboard = []
-    for category in categories:
-        notes_in_category = [note for note in get_user_notes(user_id) if note['category'] == category]
-        message += f"• *{category}* ({len(notes_in_category)} notes)\n"
-        keyboard.append([InlineKeyboardButton(f"View '{category}' Notes", callback_data=f'view_notes_page_0_cat_{category}')])
-
-    keyboard.append([InlineKeyboardButton("📋 View All Notes", callback_data='view_notes_page_0')])
-    keyboard.append([InlineKeyboardButton("➕ New Note", callback_data='new_note')])
-    keyboard.append([BACK_TO_MAIN_MENU_BUTTON]) # Added Back button
+    message = "🗂️ *Your Categories:*\n\n" + "".join(
+        f"• *{category}* ({count} notes)\n" for category, count in category_counts
+    )
+    keyboard = [
+        [InlineKeyboardButton(f"View '{category}' Notes", callback_data=f'view_notes:0:{category}')]
+        for category, _ in category_counts
+    ]
+    keyboard.extend(CATEGORIES_FOOTER_ROWS)
     reply_markup = InlineKeyboardMarkup(keyboard)
 
     await reply_func(message, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
 
-async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handles all inline button presses and routes them to appropriate logic."""
-    query = update.callback_query
-    await query.answer()
+# --- Inline button handlers ---
+# callback_data is '<action>' or '<action>:<arg>'; button_handler dispatches on the action via CALLBACK_HANDLERS
 
-    user_id = query.from_user.id
-    data = query.data
+async def button_new_note(update, context, arg):
+    """'new_note' button: start creating a note."""
+    await new_note(update, context)
 
-    context.user_data.pop('awaiting_note', None)
-    context.user_data.pop('awaiting_search', None)
-    context.user_data.pop('awaiting_category_for_note_id', None)
-
-    if data == 'new_note':
-        await new_note(update, context)
-
-    elif data.startswith('view_notes_page_'):
-        parts = data.split('_')
-        try:
-            page = int(parts[3])
-            category = None
-            if len(parts) > 4 and parts[4] == 'cat':
-                category = parts[5]
-            
-            await send_notes_page(query.message, context, page, category)
-        except (ValueError, IndexError):
-            await query.edit_message_text("❌ Invalid page or category information.", reply_markup=get_main_keyboard())
-
-    elif data == 'search_notes':
-        context.user_data['awaiting_search'] = True
-        await query.edit_message_text("🔍 What would you like to search for in your notes?")
-    
-    elif data.startswith('search_results_page_'):
-        try:
-            page = int(data.split('_')[-1])
-            query_text = context.user_data.get('last_search_query', '')
-            if not query_text:
-                await query.edit_message_text("❌ No active search query found. Please search again.", reply_markup=get_main_keyboard())
-                return
-            await send_search_results_page(query.message, context, query_text, page)
-        except (ValueError, IndexError):
-            await query.edit_message_text("❌ Invalid page information for search results.", reply_markup=get_main_keyboard())
-
-    elif data == 'view_categories':
-        await categories_command(update, context)
-
-    elif data.startswith('view_note_'):
-        try:
-            note_id = int(data.split('_')[-1])
-        except ValueError:
-            await query.edit_message_text("❌ Invalid note ID format.", reply_markup=get_main_keyboard())
-            return
-
-        note = get_user_note(user_id, note_id)
-
-        if note:
-            created_date = datetime.fromisoformat(note['created_at']).strftime('%Y-%m-%d %H:%M')
-            
-            keyboard = [
-                [InlineKeyboardButton("📋 Back to Notes", callback_data='view_notes_page_0')],
-                [InlineKeyboardButton("✏️ Edit Category", callback_data=f'edit_category_{note_id}')],
-                [InlineKeyboardButton("❌ Delete This Note", callback_data=f'delete_note_{note_id}')],
-                [InlineKeyboardButton("➕ New Note", callback_data='new_note')],
-                [BACK_TO_MAIN_MENU_BUTTON] # Added Back button
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-
-            await query.edit_message_text(
-                f"📄 *Note #{note_id}*\n\n"
-                f"📌 *Title:* {note['title']}\n"
-                f"🗂️ *Category:* {note['category']}\n"
-                f"🕒 *Created:* {created_date}\n\n"
-                f"*Content:*\n{note['content']}",
-                parse_mode=ParseMode.MARKDOWN,
-                reply_markup=reply_markup
-            )
-        else:
-            await query.edit_message_text("❌ Note not found or already deleted.", reply_markup=get_main_keyboard())
+async def button_view_notes(update, context, arg):
+    """'view_notes:<page>[:<category>]' button: show a page of notes, optionally within one category."""
+    page, _, category = arg.partition(':')
+    try:
+        await send_notes_page(update.callback_query.message, context, int(page), category or None)
+    except ValueError:
+        await update.callback_query.edit_message_text("❌ Invalid page or category information.", reply_markup=MAIN_MENU_MARKUP)
 
-    elif data.startswith('edit_category_'):
-        try:
-            note_id = int(data.split('_')[-1])
-        except ValueError:
-            await query.edit_message_text("❌ Invalid note ID format.", reply_markup=get_main_keyboard())
-            return
-        
-        note = get_user_note(user_id, note_id)
-        if note:
-            context.user_data['awaiting_category_for_note_id'] = note_id
-            await query.edit_message_text(
-                f"✏️ *Editing category for Note #{note_id}* (`{note['title'][:30]}...`)\n\n"
-                "Please send me the *new category name* for this note.\n"
-                f"Current category: `{note['category']}`",
-                parse_mode=ParseMode.MARKDOWN
-            )
-        else:
-            await query.edit_message_text("❌ Note not found or already deleted.", reply_markup=get_main_keyboard())
+async def button_search_notes(update, context, arg):
+    """'search_notes' button: prompt for a search query."""
+    context.user_data['awaiting_search'] = True
+    await update.callback_query.edit_message_text("🔍 What would you like to search for in your notes?")
 
-    elif data.startswith('delete_note_'):
-        try:
-            note_id = int(data.split('_')[-1])
-        except ValueError:
-            await query.edit_message_text("❌ Invalid note ID format.", reply_markup=get_main_keyboard())
-            return
+async def button_search_results(update, context, arg):
+    """'search_results:<page>' button: show another page of the last search."""
+    query = update.callback_query
+    try:
+        page = int(arg)
+    except ValueError:
+        await query.edit_message_text("❌ Invalid page information for search results.", reply_markup=MAIN_MENU_MARKUP)
+        return
+    query_text = context.user_data.get('last_search_query', '')
+    if not query_text:
+        await query.edit_message_text("❌ No active search query found. Please search again.", reply_markup=MAIN_MENU_MARKUP)
+        return
+    await send_search_results_page(query.message, context, query_text, page)
 
-        success = delete_user_note(user_id, note_id)
+async def button_view_categories(update, context, arg):
+    """'view_categories' button: list the user's categories."""
+    await categories_command(update, context)
 
-        if success:
-            keyboard = [
-                [InlineKeyboardButton("📋 View Notes", callback_data='view_notes_page_0')],
-                [InlineKeyboardButton("➕ New Note", callback_data='new_note')],
-                [BACK_TO_MAIN_MENU_BUTTON] # Added Back button
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_text(
-                f"✅ *Note #{note_id} deleted successfully!*",
-                parse_mode=ParseMode.MARKDOWN,
-                reply_markup=reply_markup
-            )
-        else:
-            await query.edit_message_text("❌ Note not found or already deleted.", reply_markup=get_main_keyboard())
-
-    elif data == 'stats':
-        notes = get_user_notes(user_id)
-        categories = get_user_categories(user_id)
+async def button_view_note(update, context, arg):
+    """'view_note:<id>' button: show a single note with its actions."""
+    query = update.callback_query
+    try:
+        note_id = int(arg)
+    except ValueError:
+        await query.edit_message_text("❌ Invalid note ID format.", reply_markup=MAIN_MENU_MARKUP)
+        return
 
-        total_notes = len(notes)
-        total_categories = len(categories)
+    note = get_user_note(query.from_user.id, note_id)
 
-        stats_text = f"""
-📊 *Your Statistics*
+    if note:
+        keyboard = [
+            [InlineKeyboardButton("📋 Back to Notes", callback_data='view_notes:0')],
+            [InlineKeyboardButton("✏️ Edit Category", callback_data=f'edit_category:{note_id}')],
+            [InlineKeyboardButton("❌ Delete This Note", callback_data=f'delete_note:{note_id}')],
+            [InlineKeyboardButton("➕ New Note", callback_data='new_note')],
+            [BACK_TO_MAIN_MENU_BUTTON] # Added Back button
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
 
-📝 *Total Notes:* {total_notes}
-🗂️ *Categories:* {total_categories}
-📅 *Last Updated:* {datetime.now().strftime('%Y-%m-%d %H:%M')}
+        await query.edit_message_text(
+            f"📄 *Note #{note_id}*\n\n"
+            f"📌 *Title:* {note['title_md']}\n"
+            f"🗂️ *Category:* {note['category_md']}\n"
+            f"🕒 *Created:* {created_display(note['created_at'])}\n\n"
+            f"*Content:*\n{note['content']}",
+            parse_mode=ParseMode.MARKDOWN,
+            reply_markup=reply_markup
+        )
+    else:
+        await query.edit_message_text("❌ Note not found or already deleted.", reply_markup=MAIN_MENU_MARKUP)
 
-Keep adding notes to build your knowledge base! 🚀
-"""
-        keyboard = [[BACK_TO_MAIN_MENU_BUTTON]] # Uses the constant
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(stats_text, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
+async def button_edit_category(update, context, arg):
+    """'edit_category:<id>' button: ask for a note's new category."""
+    query = update.callback_query
+    try:
+        note_id = int(arg)
+    except ValueError:
+        await query.edit_message_text("❌ Invalid note ID format.", reply_markup=MAIN_MENU_MARKUP)
+        return
 
-    elif data == 'help':
-        help_text = """
-🤖 *Notepad++ Bot Help Guide*
+    note = get_user_note(query.from_user.id, note_id)
+    if note:
+        context.user_data['awaiting_category_for_note_id'] = note_id
+        await query.edit_message_text(
+            f"✏️ *Editing category for Note #{note_id}* (`{truncate_text(note['title'], 30)}`)\n\n"
+            "Please send me the *new category name* for this note.\n"
+            f"Current category: `{note['category']}`",
+            parse_mode=ParseMode.MARKDOWN
+        )
+    else:
+        await query.edit_message_text("❌ Note not found or already deleted.", reply_markup=MAIN_MENU_MARKUP)
 
-*Commands:*
-`/start` - Start the bot and see the main menu
-`/new` - Create a new note
-`/mynotes` - View your notes (with pagination)
-`/search` - Search through notes
-`/categories` - View and navigate through categories
-`/stats` - Show your note statistics
-`/clear` - Clear all your notes
-`/help` - Show this help guide
+async def button_delete_note(update, context, arg):
+    """'delete_note:<id>' button: delete a note."""
+    query = update.callback_query
+    try:
+        note_id = int(arg)
+    except ValueError:
+        await query.edit_message_text("❌ Invalid note ID format.", reply_markup=MAIN_MENU_MARKUP)
+        return
 
-*How to Create Notes:*
-1.  Simply send any text message to save it as a "Quick Note".
-2.  For detailed notes, use the format:
-    `Title: My Awesome Note`
-    `Category: Ideas`
-    `Content: This is the detailed content of my note, it can be long and support Markdown! *bold*, _italic_, `code` etc.`
-    (Category and Title are optional, will be auto-generated or default to 'General'/'Quick Notes'.)
+    if delete_user_note(query.from_user.id, note_id):
+        await query.edit_message_text(
+            f"✅ *Note #{note_id} deleted successfully!*",
+            parse_mode=ParseMode.MARKDOWN,
+            reply_markup=POST_DELETE_MARKUP
+        )
+    else:
+        await query.edit_message_text("❌ Note not found or already deleted.", reply_markup=MAIN_MENU_MARKUP)
+
+async def button_stats(update, context, arg):
+    """'stats' button: show the user's note statistics."""
+    total_notes, total_categories = get_user_summary(update.callback_query.from_user.id)
+
+    stats_text = STATS_TEMPLATE.format(total_notes=total_notes, total_categories=total_categories, updated=current_time_display())
+    await update.callback_query.edit_message_text(stats_text, parse_mode=ParseMode.MARKDOWN, reply_markup=BACK_TO_MAIN_MENU_MARKUP)
+
+async def button_help(update, context, arg):
+    """'help' button: show the help guide."""
+    await update.callback_query.edit_message_text(HELP_TEXT, parse_mode=ParseMode.MARKDOWN, reply_markup=BACK_TO_MAIN_MENU_MARKUP)
+
+async def button_back_to_main(update, context, arg):
+    """'back_to_main' button: return to the main menu."""
+    user = update.callback_query.from_user
+    welcome_text = WELCOME_BACK_TEMPLATE.format(name=user.first_name)
+    await update.callback_query.edit_message_text(welcome_text, parse_mode=ParseMode.MARKDOWN, reply_markup=MAIN_MENU_MARKUP)
+
+CALLBACK_HANDLERS = {
+    'new_note': button_new_note,
+    'view_notes': button_view_notes,
+    'search_notes': button_search_notes,
+    'search_results': button_search_results,
+    'view_categories': button_view_categories,
+    'view_note': button_view_note,
+    'edit_category': button_edit_category,
+    'delete_note': button_delete_note,
+    'stats': button_stats,
+    'help': button_help,
+    'back_to_main': button_back_to_main,
+}
 
-*Navigation:*
-• Use the inline buttons provided with messages for easy navigation between features.
-• You can *edit a note's category* by viewing the note and clicking 'Edit Category'.
-• The "🔙 Main Menu" button will take you back to the bot's main options.
+async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handles all inline button presses and routes them to the handler registered for their action."""
+    query = update.callback_query
+    await query.answer()
 
-📝 Happy note-taking!
-"""
-        keyboard = [[BACK_TO_MAIN_MENU_BUTTON]] # Uses the constant
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(help_text, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
+    context.user_data.pop('awaiting_note', None)
+    context.user_data.pop('awaiting_search', None)
+    context.user_data.pop('awaiting_category_for_note_id', None)
 
-    elif data == 'back_to_main':
-        user = query.from_user
-        welcome_text = f"👋 *Welcome back {user.first_name}!* What would you like to do?"
-        await query.edit_message_text(welcome_text, parse_mode=ParseMode.MARKDOWN, reply_markup=get_main_keyboard())
+    action, _, arg = query.data.partition(':')
+    handler = CALLBACK_HANDLERS.get(action)
+    if handler is None:
+        # e.g. a button on an old message that uses a retired callback_data format
+        await query.edit_message_text("❌ This button is no longer valid. Please use the menu below.", reply_markup=MAIN_MENU_MARKUP)
+        return
+    await handler(update, context, arg)
 
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles the /help command."""
-    help_text = """
-🤖 *Notepad++ Bot Help*
-
-*Quick Commands:*
-`/start` - Start the bot
-`/new` - Create new note
-`/mynotes` - View your notes
-`/search` - Search notes
-`/categories` - View categories
-`/stats` - Show statistics
-`/clear` - Clear all notes
-`/help` - Show help
-
-Simply send any text message to save it as a note! Use the inline buttons for easy navigation, including the '🔙 Main Menu' button.
-"""
-    keyboard = [[BACK_TO_MAIN_MENU_BUTTON]] # Added for command handler too
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.message.reply_text(help_text, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
+    await update.message.reply_text(HELP_TEXT, parse_mode=ParseMode.MARKDOWN, reply_markup=BACK_TO_MAIN_MENU_MARKUP)
 
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles the /stats command, showing user's note statistics."""
     user_id = update.effective_user.id
-    notes = get_user_notes(user_id)
-    categories = get_user_categories(user_id)
-
-    total_notes = len(notes)
-    total_categories = len(categories)
+    total_notes, total_categories = get_user_summary(user_id)
 
-    stats_text = f"""
-📊 *Your Statistics*
-
-📝 *Total Notes:* {total_notes}
-🗂️ *Categories:* {total_categories}
-📅 *Last Updated:* {datetime.now().strftime('%Y-%m-%d %H:%M')}
-
-Keep adding notes to build your knowledge base! 🚀
-"""
-    keyboard = [[BACK_TO_MAIN_MENU_BUTTON]] # Added for command handler too
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.message.reply_text(stats_text, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
+    stats_text = STATS_TEMPLATE.format(total_notes=total_notes, total_categories=total_categories, updated=current_time_display())
+    await update.message.reply_text(stats_text, parse_mode=ParseMode.MARKDOWN, reply_markup=BACK_TO_MAIN_MENU_MARKUP)
 
 async def clear_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles the /clear command, deleting all notes for the current user."""
     user_id = update.effective_user.id
-    user_id_str = str(user_id)
-
-    if user_id_str in user_data['notes'] and user_data['notes'][user_id_str]:
-        user_data['notes'][user_id_str] = []
-        if user_id_str in user_data['settings']:
-            user_data['settings'][user_id_str]['next_note_id'] = 1
-        save_user_data()
-        keyboard = [[BACK_TO_MAIN_MENU_BUTTON]] # Added Back button
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.message.reply_text("✅ All your notes have been cleared!", reply_markup=reply_markup)
+
+    if clear_user_notes(user_id):
+        await update.message.reply_text("✅ All your notes have been cleared!", reply_markup=BACK_TO_MAIN_MENU_MARKUP)
     else:
-        keyboard = [[BACK_TO_MAIN_MENU_BUTTON]] # Added Back button
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.message.reply_text("📭 You don't have any notes to clear.", reply_markup=reply_markup)
+        await update.message.reply_text("📭 You don't have any notes to clear.", reply_markup=BACK_TO_MAIN_MENU_MARKUP)
+
+COMMAND_HANDLERS = (
+    ("start", start),
+    ("new", new_note),
+    ("mynotes", my_notes),
+    ("search", search_command),
+    ("categories", categories_command),
+    ("help", help_command),
+    ("stats", stats_command),
+    ("clear", clear_command),
+)
 
 def main():
     """Starts the bot by initializing the Telegram Application and adding all handlers."""
-    application = Application.builder().token(BOT_TOKEN).build()
-
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("new", new_note))
-    application.add_handler(CommandHandler("mynotes", my_notes))
-    application.add_handler(CommandHandler("search", search_command))
-    application.add_handler(CommandHandler("categories", categories_command))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("stats", stats_command))
-    application.add_handler(CommandHandler("clear", clear_command))
-    
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-    
-    application.add_handler(CallbackQueryHandler(button_handler))
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .post_shutdown(close_database)
+        .build()
+    )
+
+    # block=False lets updates from different users be processed concurrently instead of one after another
+    for command, callback in COMMAND_HANDLERS:
+        application.add_handler(CommandHandler(command, callback, block=False))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message, block=False))
+    application.add_handler(CallbackQueryHandler(button_handler, block=False))
 
     print("🤖 Notepad++ Bot is running...")
-    print(f"💾 Using JSON file storage: {DATA_FILE}")
+    print(f"💾 Using SQLite storage in: {DB_FILE}")
     print("🚀 Ready to receive messages!")
 
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if WEBHOOK_URL:
+        # Updates are pushed to us as they happen instead of waiting on a getUpdates round-trip
+        print(f"🌐 Listening for webhook updates on port {PORT}")
+        application.run_webhook(
+            listen='0.0.0.0',
+            port=PORT,
+            secret_token=WEBHOOK_SECRET,
+            webhook_url=WEBHOOK_URL,
+            allowed_updates=Update.ALL_TYPES
+        )
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == '__main__':
     main()